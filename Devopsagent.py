@@ -1,118 +1,293 @@
 import os
-import docker
+import hashlib
+import logging
+import stat
 import sys
-from langchain_core.messages import HumanMessage
-from langchain_openai import AzureChatOpenAI
+import textwrap
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+log = logging.getLogger(__name__)
+
+# docker and langchain_* are imported lazily so importing this module (e.g. from
+# the Flask app) stays cheap and does not require the SDKs until a run needs them.
+
+# Directories that never contain useful project context
+SKIP_DIRS = {'.git', 'node_modules', 'venv', '.venv', '__pycache__', 'dist', 'build'}
+MAX_CONTEXT_FILES = 8
+
+# Patterns kept out of the Docker build context, merged with the project's own
+# .dockerignore. Docker patterns are root-relative, hence the '**/' prefixes.
+BUILD_CONTEXT_EXCLUDES = (
+    '.git', '**/__pycache__', '**/*.pyc', 'venv', '.venv',
+    '**/node_modules', 'temp_project_files', '**/*.log',
+)
+
+# Files the agent regenerates on every run
+GENERATED_FILES = ('Dockerfile', 'docker_entrypoint.py', '.dockerignore')
+
+# Build log output is flushed every N chunks or after this many seconds
+LOG_FLUSH_CHUNKS = 32
+LOG_FLUSH_SECONDS = 0.25
+
+# Entrypoint copied into the target repo; forces the server onto 0.0.0.0:5000
+ENTRYPOINT_SCRIPT = """try:
+    from app import app
+    print("Successfully imported 'app' from app.py")
+except ImportError as e:
+    print(f"Could not import 'app': {e}")
+    print("Creating fallback app...")
+    from flask import Flask
+    app = Flask(__name__)
+    @app.route('/')
+    def home():
+        return "<h1>Fallback App</h1><p>The container is running, but app.py failed to load.</p>"
+
+if __name__ == "__main__":
+    print("Starting Server on 0.0.0.0:5000")
+    try:
+        # Production WSGI server when the project ships it
+        from waitress import serve
+        serve(app, host='0.0.0.0', port=5000, threads=8)
+    except ImportError:
+        app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+"""
+
+# Dedented once at import; only the project context varies per call
+DOCKERFILE_PROMPT = textwrap.dedent("""
+        You are a DevOps Expert. Write a SIMPLE, WORKING Dockerfile.
+        
+        Project Context:
+        {context}
+        
+        STRICT RULES (multi-stage build):
+        1. Builder Stage: FROM python:3.9-slim AS builder
+           WORKDIR /app
+           (If requirements.txt has numpy/pandas, install 'build-essential' in THIS stage only)
+        2. Dependencies (as two separate instructions, BEFORE copying the code):
+           COPY requirements.txt .
+           RUN pip install --no-cache-dir uv && uv pip install --system --no-cache --prefix=/install -r requirements.txt
+        3. Runtime Stage: FROM python:3.9-slim
+           COPY --from=builder /install /usr/local
+           WORKDIR /app
+        4. Copy Code: COPY . .  (must come AFTER the dependencies so code edits keep the dependency layer cached)
+        5. Network: EXPOSE 5000
+        6. Command: CMD ["python", "docker_entrypoint.py"]
+        7. Do NOT use RUN --mount or a '# syntax=' line (the image is built with the classic builder).
+        
+        OUTPUT ONLY THE RAW DOCKERFILE CONTENT.
+        """)
+
+_DOCKER = None
+
+def _docker():
+    """Returns a process-wide Docker client, connecting to the daemon on first use."""
+    global _DOCKER
+    if _DOCKER is None:
+        import docker
+        _DOCKER = docker.from_env(timeout=120)
+    return _DOCKER
+
+@lru_cache(maxsize=1)
+def _get_llm():
+    """Builds the Azure client once per process so its HTTP keep-alive pool is reused."""
+    from langchain_community.cache import SQLiteCache
+    from langchain_core.globals import set_llm_cache
+    from langchain_openai import AzureChatOpenAI
+
+    # Persistent LLM cache: identical prompts (same repo context + deployment) are
+    # served from disk instead of hitting Azure again.
+    set_llm_cache(SQLiteCache(database_path=os.getenv("LLM_CACHE_PATH", ".devops_llm.db")))
+    return AzureChatOpenAI(
+        azure_deployment=os.getenv("AZURE_DEPLOYMENT"),
+        api_version=os.getenv("AZURE_VERSION"),
+        azure_endpoint=os.getenv("AZURE_END_POINT"),
+        api_key=os.getenv("AZURE_API_KEY"),
+        # Deterministic output keeps the LLM cache effective; a Dockerfile is short
+        temperature=0,
+        max_tokens=400
+    )
+
+def _write_file(path, content, sync=False):
+    """Writes UTF-8 text with LF line endings via a raw os.write, bypassing TextIOWrapper."""
+    # LLM output may carry CRLF; normalise in one C-level pass over the encoded bytes
+    data = memoryview(content.encode('utf-8').replace(b"\r\n", b"\n"))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        # A single write for these small files; loop only guards against short writes
+        while data:
+            data = data[os.write(fd, data):]
+        if sync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _read_head(path, lines=50):
+    """Returns the first lines of a file, or None if it cannot be read."""
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return "".join(islice(f, lines))
+    except Exception as e:
+        log.warning("Could not read %s: %s", os.path.basename(path), e)
+        return None
 
 class DevOpsAgent:
     def __init__(self, repo_path):
         # FIX: Convert to Absolute Path immediately to prevent Docker "Ghost Builds"
         self.repo_path = os.path.abspath(repo_path)
-        print(f"[DEBUG] Initializing Agent for Absolute Path: {self.repo_path}")
+        log.debug("Initializing Agent for Absolute Path: %s", self.repo_path)
         
         self.project_name = os.path.basename(os.path.normpath(repo_path))
+        # (paths, mtime fingerprint, context) from the last project scan
+        self._context_cache = None
         
         try:
-            self.llm = AzureChatOpenAI(
-                azure_deployment=os.getenv("AZURE_DEPLOYMENT"),
-                api_version=os.getenv("AZURE_VERSION"),
-                azure_endpoint=os.getenv("AZURE_END_POINT"),
-                api_key=os.getenv("AZURE_API_KEY"),
-                temperature=0.2 
-            )
+            self.llm = _get_llm()
+        except ImportError as e:
+            # The SDKs are imported lazily, so a missing package surfaces here
+            raise ImportError(f"❌ Missing dependency for Azure OpenAI ({e.name or e}). Install the packages in requirements.txt.") from e
         except Exception as e:
             raise ValueError(f"❌ Failed to initialize Azure OpenAI. Check your ENV variables. Error: {e}")
 
-    def _get_project_context(self):
-        """Reads key config files with robust encoding."""
-        print("[DEBUG] Scanning for project files...")
-        context = ""
-        critical_files = ['requirements.txt', 'package.json', 'app.py', 'main.py']
+    def _find_context_files(self):
+        """Collects up to MAX_CONTEXT_FILES critical files, skipping heavy directories."""
+        critical_files = {'requirements.txt', 'package.json', 'app.py', 'main.py'}
+        paths = []
         
-        for root, _, files in os.walk(self.repo_path):
+        for root, dirs, files in os.walk(self.repo_path):
+            # Prune heavy directories in place so os.walk never descends into them
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
             for file in files:
                 if file in critical_files:
-                    path = os.path.join(root, file)
-                    try:
-                        # Try UTF-8 first, fallback to Latin-1
-                        try:
-                            with open(path, 'r', encoding='utf-8') as f:
-                                file_content = "".join([next(f) for _ in range(50)])
-                        except UnicodeDecodeError:
-                            with open(path, 'r', encoding='latin-1') as f:
-                                file_content = "".join([next(f) for _ in range(50)])
-                                
-                        context += f"\n--- FILE: {file} ---\n{file_content}\n"
-                    except Exception as e:
-                        print(f"[WARN] Could not read {file}: {e}")
+                    paths.append(os.path.join(root, file))
+                    # The LLM only needs a representative sample
+                    if len(paths) >= MAX_CONTEXT_FILES:
+                        return paths
+        return paths
+
+    def _context_fingerprint(self, paths):
+        """Cheap change detector for a set of previously scanned files."""
+        try:
+            return tuple(os.stat(p).st_mtime_ns for p in paths)
+        except OSError:
+            return None
+
+    def _get_project_context(self):
+        """Reads key config files concurrently, replacing undecodable bytes."""
+        # Reuse the previous scan while none of the scanned files has changed
+        if self._context_cache is not None:
+            paths, fingerprint, context = self._context_cache
+            if fingerprint is not None and self._context_fingerprint(paths) == fingerprint:
+                return context
+
+        log.debug("Scanning for project files...")
+        paths = self._find_context_files()
+        
+        # Reads are I/O-bound, so overlapping them pays off on slow/networked disks
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            heads = list(executor.map(_read_head, paths))
+        
+        context = ""
+        for path, file_content in zip(paths, heads):
+            if file_content is not None:
+                context += f"\n--- FILE: {os.path.basename(path)} ---\n{file_content}\n"
+
+        self._context_cache = (paths, self._context_fingerprint(paths), context)
         return context
 
     def ensure_entrypoint(self):
         """Creates a dedicated entrypoint script to force binding to 0.0.0.0."""
-        print("🔧 Creating Docker Entrypoint...")
+        log.info("🔧 Creating Docker Entrypoint...")
         
-        entrypoint_content = """import sys
-import os
-
-try:
-    from app import app
-    print("Successfully imported 'app' from app.py")
-except ImportError as e:
-    print(f"Could not import 'app': {e}")
-    print("Creating fallback app...")
-    from flask import Flask
-    app = Flask(__name__)
-    @app.route('/')
-    def home():
-        return "<h1>Fallback App</h1><p>The container is running, but app.py failed to load.</p>"
-
-if __name__ == "__main__":
-    print("Starting Server on 0.0.0.0:5000")
-    app.run(host='0.0.0.0', port=5000)
-"""
         target_file = os.path.join(self.repo_path, 'docker_entrypoint.py')
         try:
-            with open(target_file, 'w', encoding='utf-8') as f:
-                f.write(entrypoint_content)
-                f.flush()
-                os.fsync(f.fileno())
+            _write_file(target_file, ENTRYPOINT_SCRIPT, sync=True)
             
             if os.path.getsize(target_file) > 0:
-                print(f"[DEBUG] ✅ Entrypoint created successfully ({os.path.getsize(target_file)} bytes)")
+                log.debug("✅ Entrypoint created successfully (%d bytes)", os.path.getsize(target_file))
             else:
-                print("[CRITICAL ERROR] ❌ Entrypoint file is empty after write!")
+                log.error("❌ Entrypoint file is empty after write!")
         except Exception as e:
-            print(f"[CRITICAL ERROR] ❌ Error writing entrypoint: {str(e)}")
+            log.error("❌ Error writing entrypoint: %s", e)
 
-    def generate_dockerfile(self, context):
-        print(f"[DEBUG] Generating Dockerfile for {self.project_name}...")
+    def ensure_dockerignore(self):
+        """Merges the agent's excludes into .dockerignore and returns the combined patterns."""
+        target_file = os.path.join(self.repo_path, '.dockerignore')
+        project_patterns = []
+        if os.path.isfile(target_file):
+            # Same parsing as docker-py: stripped lines, no blanks or comments
+            with open(target_file, 'r', encoding='utf-8', errors='replace') as f:
+                project_patterns = [line.strip() for line in f]
+            project_patterns = [p for p in project_patterns if p and not p.startswith('#')]
         
-        prompt = f"""
-        You are a DevOps Expert. Write a SIMPLE, WORKING Dockerfile.
+        # Project patterns go last so their '!' re-includes still win. Merging an
+        # already-merged file yields the same list, so reruns stay stable.
+        excludes = list(BUILD_CONTEXT_EXCLUDES)
+        excludes += [p for p in project_patterns if p not in BUILD_CONTEXT_EXCLUDES]
+        _write_file(target_file, "\n".join(excludes) + "\n")
+        return tuple(excludes)
+
+    def _build_context_files(self, excludes):
+        """Lists the build context exactly as docker-py would tar it."""
+        from docker.utils.build import exclude_paths
+        # exclude_paths appends '!Dockerfile' to the list it gets, so pass a copy
+        return sorted(exclude_paths(self.repo_path, list(excludes)))
+
+    def _source_fingerprint(self, context_files):
+        """Hashes the build context: file metadata, plus contents of files the agent rewrites."""
+        digest = hashlib.blake2b(digest_size=8)
         
-        Project Context:
-        {context}
+        for relpath in context_files:
+            digest.update(relpath.encode() + b"\0")
+            path = os.path.join(self.repo_path, relpath)
+            st = os.lstat(path)
+            if stat.S_ISDIR(st.st_mode):
+                continue
+            if relpath in GENERATED_FILES:
+                # Rewritten every run, so mtime always changes; hash the content instead
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+            else:
+                digest.update(f"{st.st_mtime_ns}:{st.st_size}".encode())
+        return digest.hexdigest()
+
+    def _promote_image(self, client, container_name, image_tag):
+        """Points <name>:latest at image_tag and untags the fingerprint image it replaces."""
+        import docker
+        latest_tag = f"{container_name}:latest"
+        image = client.images.get(image_tag)
+        try:
+            previous = client.images.get(latest_tag)
+        except docker.errors.ImageNotFound:
+            previous = None
         
-        STRICT RULES:
-        1. Base Image: python:3.9-slim
-        2. Workdir: /app
-        3. Install: COPY requirements.txt . && pip install --no-cache-dir -r requirements.txt
-           (If requirements.txt has numpy/pandas, install 'build-essential' first)
-        4. Copy Code: COPY . .
-        5. Network: EXPOSE 5000
-        6. Command: CMD ["python", "docker_entrypoint.py"]
+        image.tag(container_name, 'latest')
+        if previous is None or previous.id == image.id:
+            return
+        # Tagged images are never pruned, so drop the superseded fingerprint tag(s)
+        for tag in previous.tags:
+            if tag.startswith(f"{container_name}:") and tag != latest_tag:
+                try:
+                    client.images.remove(tag)
+                except docker.errors.APIError as e:
+                    log.warning("Could not untag old image %s: %s", tag, e)
+
+    def generate_dockerfile(self, context):
+        log.info("Generating Dockerfile for %s...", self.project_name)
         
-        OUTPUT ONLY THE RAW DOCKERFILE CONTENT.
-        """
+        prompt = DOCKERFILE_PROMPT.format(context=context)
+
+        from langchain_core.messages import HumanMessage
 
         messages = [HumanMessage(content=prompt)]
         response = self.llm.invoke(messages)
         content = response.content.replace("```dockerfile", "").replace("```", "").strip()
         
-        with open(os.path.join(self.repo_path, 'Dockerfile'), 'w', encoding='utf-8') as f:
-            f.write(content)
+        _write_file(os.path.join(self.repo_path, 'Dockerfile'), content)
             
-        print("[DEBUG] Dockerfile Written.")
+        log.info("Dockerfile Written.")
         return "Dockerfile (Using docker_entrypoint.py)"
 
     def generate_docker_compose(self, context):
@@ -122,59 +297,100 @@ if __name__ == "__main__":
         return ".github/workflows/main.yml (Skipped)"
 
     def deploy_container(self):
-        print(f"[DEBUG] Starting Deployment for {self.project_name}...")
+        log.info("Starting Deployment for %s...", self.project_name)
         
         try:
-            client = docker.from_env()
-            # Convert tag to lowercase to comply with Docker rules
-            image_tag = self.project_name.lower()
-            
-            # 1. Build with STREAMING LOGS
-            print("   Step 1: Building Image (Streaming Logs)...")
+            import docker
+            client = _docker()
+            # Convert names to lowercase to comply with Docker rules
+            container_name = self.project_name.lower()
             
+            # Tag images by source fingerprint so an unchanged tree skips the build entirely
+            build_excludes = self.ensure_dockerignore()
+            # One matcher decides both what is hashed and what is sent to the daemon
+            context_files = self._build_context_files(build_excludes)
+            image_tag = f"{container_name}:{self._source_fingerprint(context_files)}"
             try:
-                # Use ABSOLUTE PATH here
-                build_generator = client.api.build(
-                    path=self.repo_path, # Now guaranteed to be absolute
-                    tag=image_tag,
-                    rm=True,
-                    decode=True
-                )
+                client.images.get(image_tag)
+                image_cached = True
+            except docker.errors.ImageNotFound:
+                image_cached = False
+            
+            if image_cached:
+                log.info("Step 1: Image %s already matches the source tree, skipping build.", image_tag)
+            else:
+                # 1. Build with STREAMING LOGS
+                log.info("Step 1: Building Image (Streaming Logs)...")
+            
+                try:
+                    # Pre-build a filtered context so excluded files never reach the daemon
+                    build_context = docker.utils.build.create_archive(
+                        root=self.repo_path, # Now guaranteed to be absolute
+                        files=context_files
+                    )
+                    build_generator = client.api.build(
+                        fileobj=build_context,
+                        custom_context=True,
+                        tag=image_tag,
+                        rm=True,
+                        decode=True
+                    )
                 
-                build_success = False
-                for chunk in build_generator:
-                    # Print any message from Docker to debug "Ghost Builds"
-                    if 'stream' in chunk:
-                        print(chunk['stream'], end='')
-                        build_success = True # We saw at least one log line
-                    elif 'error' in chunk:
-                        raise Exception(f"Build Error: {chunk['error']}")
-                    else:
-                        # Print raw chunk for debugging unknown responses
-                        print(f"[RAW DOCKER]: {chunk}")
+                    build_success = False
+                    # Batch log lines so chatty builds (apt-get, pip) don't cost a write per chunk
+                    log_buffer = []
+                    last_flush = time.monotonic()
+
+                    def flush_logs():
+                        sys.stdout.write("".join(log_buffer))
+                        sys.stdout.flush()
+                        log_buffer.clear()
+
+                    try:
+                        for chunk in build_generator:
+                            # Print any message from Docker to debug "Ghost Builds"
+                            if 'stream' in chunk:
+                                log_buffer.append(chunk['stream'])
+                                build_success = True # We saw at least one log line
+                            elif 'error' in chunk:
+                                raise Exception(f"Build Error: {chunk['error']}")
+                            else:
+                                # Print raw chunk for debugging unknown responses
+                                log_buffer.append(f"[RAW DOCKER]: {chunk}\n")
+
+                            if len(log_buffer) >= LOG_FLUSH_CHUNKS or time.monotonic() - last_flush > LOG_FLUSH_SECONDS:
+                                flush_logs()
+                                last_flush = time.monotonic()
+                    finally:
+                        flush_logs()
                 
-                if not build_success:
-                    print("\n[WARNING] Docker returned no stream logs. Context might be empty.")
+                    if not build_success:
+                        log.warning("Docker returned no stream logs. Context might be empty.")
 
-                print("\n   ✅ Build Stream Finished.")
+                    log.info("✅ Build Stream Finished.")
                 
-                # SAFETY CHECK: Verify image exists
-                client.images.get(image_tag)
+                    # SAFETY CHECK: Verify image exists
+                    client.images.get(image_tag)
 
-            except Exception as build_err:
-                raise Exception(f"Docker Build Failed: {str(build_err)}")
+                except Exception as build_err:
+                    raise Exception(f"Docker Build Failed: {str(build_err)}")
 
             # 2. Cleanup Old Container
-            print("[DEBUG] Cleaning up old containers...")
+            log.debug("Cleaning up old containers...")
             try:
-                old = client.containers.get(image_tag)
-                old.stop()
-                old.remove()
-            except: 
-                pass
+                # One list call; the steady state (no old container) needs no further round-trips
+                existing = client.containers.list(all=True, filters={'name': f"^/{container_name}$"})
+                for old in existing:
+                    # force=True kills and removes in one call; no separate stop()
+                    old.remove(force=True)
+            except docker.errors.APIError as cleanup_err:
+                log.warning("Could not remove old container: %s", cleanup_err)
+            
+            # The old container is gone, so its image can now be untagged
+            self._promote_image(client, container_name, image_tag)
             
             # 3. Run with Environment Variables
-            print("   Step 2: Starting Container (Mapping 8000->5000)...")
+            log.info("Step 2: Starting Container (Mapping 8000->5000)...")
             
             env_vars = {
                 "TAVILY_API_KEY": os.getenv("TAVILY_API_KEY"),
@@ -189,16 +405,16 @@ if __name__ == "__main__":
             container = client.containers.run(
                 image_tag,
                 detach=True,
-                name=image_tag,
+                name=container_name,
                 ports={'5000/tcp': 8000},
                 environment=env_vars
             )
-            print(f"[DEBUG] Container Started! ID: {container.id}")
+            log.info("Container Started! ID: %s", container.id)
             
             return "✅ Deployed! Access at: http://localhost:8000"
 
         except Exception as e:
-            print(f"[CRITICAL ERROR] Deployment Failed: {str(e)}")
+            log.error("Deployment Failed: %s", e)
             return f"❌ Deployment Failed: {str(e)}"
 
     def run(self):
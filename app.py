@@ -1,17 +1,79 @@
 import os
+import glob
+import hashlib
+import logging
 import shutil
-import uuid
+import sys
+import tempfile
+import threading
 import git
 from flask import Flask, render_template, request
 # Import our new Agent class
 from Devopsagent import DevOpsAgent
 
 app = Flask(__name__)
+log = logging.getLogger(__name__)
 
 # Helper to clean up URLs
 def clean_url(url):
     return url.strip().rstrip('/')
 
+CHECKOUT_ROOT = "./temp_project_files"
+
+# Fixed pool of striped locks: the threaded server may handle the same repo twice at
+# once, and a key always maps to the same lock without the pool growing per commit
+CHECKOUT_LOCK_STRIPES = 16
+_checkout_locks = [threading.Lock() for _ in range(CHECKOUT_LOCK_STRIPES)]
+
+def checkout_lock(key):
+    return _checkout_locks[int(key, 16) % CHECKOUT_LOCK_STRIPES]
+
+# Helper to key a checkout on URL + remote HEAD so repeat submissions skip the clone
+def checkout_key(clean_repo_url, auth_url):
+    remote_head = git.cmd.Git().ls_remote(auth_url, 'HEAD').split()
+    head_sha = remote_head[0] if remote_head else ''
+    key = hashlib.sha256(f"{clean_repo_url}@{head_sha}".encode()).hexdigest()[:16]
+    return key, head_sha
+
+# Helper to clone a repo, reusing an existing checkout. Caller must hold checkout_lock(key).
+def checkout_repo(clean_repo_url, auth_url, key, head_sha):
+    download_path = os.path.join(CHECKOUT_ROOT, key)
+
+    if os.path.isdir(download_path):
+        try:
+            # Same commit is already on disk; just discard edits from the previous run
+            git.Repo(download_path).git.reset('--hard', 'HEAD')
+            log.info("Reusing checkout of %s at %s...", clean_repo_url, head_sha[:7])
+            return download_path
+        except (git.InvalidGitRepositoryError, git.NoSuchPathError, git.GitCommandError) as e:
+            log.warning("Discarding broken checkout %s: %s", download_path, e)
+            shutil.rmtree(download_path, ignore_errors=True)
+
+    log.info("Cloning %s...", clean_repo_url)
+    # Clone next to the target and rename into place, so an interrupted clone
+    # never leaves a half-populated directory under the final name
+    os.makedirs(CHECKOUT_ROOT, exist_ok=True)
+    # Temp clones left by a killed process or restart; safe to drop under this key's lock
+    for stale_path in glob.glob(os.path.join(CHECKOUT_ROOT, f".{key}-*")):
+        log.debug("Removing stale partial clone %s", stale_path)
+        shutil.rmtree(stale_path, ignore_errors=True)
+    tmp_path = tempfile.mkdtemp(prefix=f".{key}-", dir=CHECKOUT_ROOT)
+    try:
+        # Shallow clone: the agent only needs the tip tree, not the history
+        git.Repo.clone_from(
+            auth_url,
+            tmp_path,
+            depth=1,
+            single_branch=True,
+            no_tags=True,
+            env={'GIT_LFS_SKIP_SMUDGE': '1'}
+        )
+        os.rename(tmp_path, download_path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return download_path
+
 @app.route('/', methods=['GET', 'POST'])
 def home():
     agent_report = []
@@ -21,32 +83,27 @@ def home():
         submitted_url = request.form.get('repoUrl')
         token = request.form.get('githubToken')
         
-        # 1. Prepare Paths
-        session_id = str(uuid.uuid4())
-        download_path = os.path.join("./temp_project_files", session_id)
-        
-        # Clean up previous runs to avoid conflicts
-        if os.path.exists(download_path):
-            shutil.rmtree(download_path)
-            
-        # 2. Construct Auth URL (if token provided)
+        # 1. Construct Auth URL (if token provided)
         clean_repo_url = clean_url(submitted_url)
         auth_url = clean_repo_url
         if token and token.strip() and clean_repo_url.startswith("https://"):
             auth_url = clean_repo_url.replace("https://", f"https://{token}@")
 
         try:
-            # 3. Clone Repository
-            print(f"Cloning {clean_repo_url}...")
-            git.Repo.clone_from(auth_url, download_path)
-            
-            # 4. Trigger Autonomous Agent
-            print("Initializing DevOps Agent...")
-            agent = DevOpsAgent(download_path)
-            
-            # Agent analyzes code and writes Dockerfile/Workflow to the temp folder
-            agent_report = agent.run()
-            print(agent_report)
+            key, head_sha = checkout_key(clean_repo_url, auth_url)
+            # Hold the checkout for the whole run so another request for the same
+            # commit cannot reset or re-clone it while the agent is building
+            with checkout_lock(key):
+                # 2. Fetch Repository (reuses an existing checkout of the same commit)
+                download_path = checkout_repo(clean_repo_url, auth_url, key, head_sha)
+                
+                # 3. Trigger Autonomous Agent
+                log.info("Initializing DevOps Agent...")
+                agent = DevOpsAgent(download_path)
+                
+                # Agent analyzes code and writes Dockerfile/Workflow to the temp folder
+                agent_report = agent.run()
+            log.info("Agent report: %s", agent_report)
             
             # (Optional) Here you could push the changes back to GitHub 
             # using repo.index.add and repo.remotes.origin.push()
@@ -57,5 +114,12 @@ def home():
     return render_template('index.html', submitted_url=submitted_url, files=agent_report)
 
 if __name__ == '__main__':
+    # Configure logging only when run directly, so importing this module leaves it alone.
+    # stdout keeps log lines in order with the streamed Docker build output.
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO"),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        stream=sys.stdout
+    )
     # Ensure you have 'flask' and 'GitPython' installed
-    app.run(debug=True, port=5000,use_reloader=False)
\ No newline at end of file
+    app.run(debug=False, port=5000, threaded=True, use_reloader=False)
\ No newline at end of file